@@ -1,11 +1,13 @@
 let input = document.getElementById("messageText")
 let button = document.getElementById("sendButton")
 let messages = document.getElementById('messages')
-let ws = new WebSocket("ws://localhost:8000/ws")
+// The mailbox of the chat session is given by the page URL, e.g. http://localhost:8000/?account=alice@example.com
+let account = new URLSearchParams(window.location.search).get("account")
+let ws = new WebSocket("ws://localhost:8000/ws" + (account ? `?account=${encodeURIComponent(account)}` : ""))
 
 const appendMessage = (messageContent, side) => {
     let message = document.createElement('div')
-    message.classList.add("message-type", side)
+    message.classList.add("message-type", ...side.split(" "))
     let content = document.createTextNode(messageContent)
     message.appendChild(content)
     messages.appendChild(message)
@@ -25,15 +27,37 @@ const manageToggleForm = (isDisabled) => {
     }
 }
 
+const statusMessages = {
+    queued: (data) => `Your message is queued (position ${data.position}).`,
+    waiting: (data) => "The assistant is busy, your message will be processed shortly.",
+    rejected: (data) => data.detail,
+    error: (data) => data.detail,
+    cancelled: (data) => "The previous request was cancelled.",
+}
+
 ws.onmessage = (event) => {
-    appendMessage(event.data, "left")
-    manageToggleForm(false)
+    let data = JSON.parse(event.data)
+    if (data.type === "answer"){
+        appendMessage(data.content, "left")
+    }
+    else if (data.type === "status" && data.status in statusMessages){
+        appendMessage(statusMessages[data.status](data), "left status")
+    }
+}
+
+// The input stays enabled while a turn runs: new messages are queued by the server 
+// (or supersede the running turn, depending on SESSION_POLICY). It is only disabled once the connection is lost.
+ws.onclose = (event) => {
+    appendMessage("Connection lost, reload the page to start a new session.", "left status")
+    manageToggleForm(true)
 }
 
 const sendMessage = (event) => {
+    event.preventDefault()
+    if (!input.value.trim()){
+        return
+    }
     ws.send(input.value)
     appendMessage(input.value, "right")
     input.value = ''
-    manageToggleForm(true)
-    event.preventDefault()
 }
\ No newline at end of file
@@ -57,4 +57,16 @@ def create_agent_graph(tools: list) -> StateGraph:
     graph_builder.add_edge("tools", "llm_call")
            
     graph = graph_builder.compile(checkpointer = memory)
-    return graph
\ No newline at end of file
+    return graph
+
+def create_light_llm() -> ChatGoogleGenerativeAI:
+    '''
+    Creates the cheaper LLM used by the intent router to phrase fast-path answers.
+
+    Returns:
+        ChatGoogleGenerativeAI: The LLM, configured by the ROUTER_MODEL environment variable.
+    '''
+    return ChatGoogleGenerativeAI(model = os.getenv("ROUTER_MODEL", "gemini-2.5-flash-lite"),
+                                  temperature = 0,
+                                  google_api_key = GEMINI_API_KEY
+                                 )
\ No newline at end of file
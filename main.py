@@ -1,9 +1,13 @@
 import os
 import asyncio
 import json
+import uuid
 # Importing Langchain/Langgraph packages
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import (HumanMessage,
+                                     AIMessage,
+                                     )
 # FastAPI/Backend imports
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketException, WebSocketDisconnect, Request
@@ -12,8 +16,16 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
 
-from graph import create_agent_graph
+from graph import (create_agent_graph,
+                   create_light_llm,
+                   )
+from router import IntentRouter
+from shards import (bind_account,
+                    load_tools,
+                    )
+from servers.accounts import DEFAULT_ACCOUNT
 from prompts import google_assistant_prompt
+from scheduler import SessionScheduler
 
 # Defining prompt template
 prompt_template = ChatPromptTemplate(
@@ -31,14 +43,24 @@ async def lifespan(app: FastAPI):
     with open("./servers/mcp_config.json", "r") as config:
         mcp_config = json.load(config)
     client = MultiServerMCPClient(mcp_config)
-    tools = await client.get_tools()
+    # The mailbox of each tool call is the one of the websocket session, never chosen by the LLM.
+    tools = [bind_account(tool) for tool in await load_tools(client, mcp_config)]
 
     # Initialize agent.
-    memory_config = {"configurable": {"thread_id": "1"}}
     agent = create_agent_graph(tools = tools)
     agent_chain = (prompt_template | agent)
+    # Simple requests are answered with a single tool call, without the agent loop.
+    router = IntentRouter.from_file(path = "./intents.json", tools = tools, llm = create_light_llm())
+
+    async def answer_query(query: str, memory_config: dict) -> str:
+        if (answer := await router.route(query, config = memory_config)) is not None:
+            # Keep the fast-path turn in the agent memory for follow-up questions.
+            await agent.aupdate_state(memory_config,
+                                      {"messages": [HumanMessage(query), AIMessage(answer)]},
+                                      as_node = "llm_call",
+                                      )
+            return answer
 
-    async def run_agent(query: str) -> str:
         answer = None
         async for event in agent_chain.astream(
                                         {"tools": tools,
@@ -49,9 +71,48 @@ async def lifespan(app: FastAPI):
             if event.get("llm_call") is not None and (response := event["llm_call"]["messages"][0].content):
                 answer = response
         return answer
-    
+
+    # Checkpoints to resume from, for the threads whose last turn was cancelled.
+    resume_configs = {}
+    # Mailbox of each websocket session.
+    session_accounts = {}
+
+    async def run_agent(query: str, thread_id: str) -> str:
+        # Each websocket session has its own conversation memory and mailbox.
+        memory_config = resume_configs.get(thread_id, {"configurable": {"thread_id": thread_id}})
+        previous_state = await agent.aget_state(memory_config)
+        resume_configs.pop(thread_id, None)
+        memory_config = {"configurable": {**memory_config["configurable"],
+                                          "account": session_accounts.get(thread_id, DEFAULT_ACCOUNT),
+                                          }}
+        try:
+            return await answer_query(query, memory_config)
+        except asyncio.CancelledError:
+            # A turn cancelled in the middle of the graph may leave tool calls without response in memory,
+            # which Gemini rejects: the next turn starts again from the checkpoint taken before this one.
+            if "checkpoint_id" in previous_state.config["configurable"]:
+                resume_configs[thread_id] = previous_state.config
+            else:
+                await agent.checkpointer.adelete_thread(thread_id)
+            raise
+
+    async def end_session(thread_id: str) -> None:
+        # Release the memory of closed sessions.
+        resume_configs.pop(thread_id, None)
+        session_accounts.pop(thread_id, None)
+        await agent.checkpointer.adelete_thread(thread_id)
+
     # Make agent accessible to websocket.   
     app.state.run_agent = run_agent
+    app.state.session_accounts = session_accounts
+    # Bound the turns running and waiting across websocket sessions.
+    app.state.scheduler = SessionScheduler(run_turn = run_agent,
+                                           max_concurrency = int(os.getenv("MAX_CONCURRENT_TURNS", 4)),
+                                           max_queue = int(os.getenv("MAX_SESSION_QUEUE", 3)),
+                                           max_pending = int(os.getenv("MAX_PENDING_TURNS", 32)),
+                                           policy = os.getenv("SESSION_POLICY", "queue"),
+                                           end_session = end_session,
+                                           )
 
     yield
 
@@ -66,14 +127,20 @@ async def get(request: Request):
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    # The session mailbox is given by the "account" query parameter (e.g. /ws?account=alice@example.com).
+    session_id = uuid.uuid4().hex
+    app.state.session_accounts[session_id] = websocket.query_params.get("account", DEFAULT_ACCOUNT)
+    session = app.state.scheduler.open_session(session_id = session_id, send = websocket.send_json)
     try:
-        await websocket.accept()
         while True:
             user_input = await websocket.receive_text()
-            response = await app.state.run_agent(query = user_input)
-            await websocket.send_text(response)
+            await session.submit(user_input)
     except WebSocketDisconnect as error:
         print(f"Connection closed.\nMore info: {error}")
+    finally:
+        # Cancel the running turn and drop the queued ones of abandoned sessions.
+        await session.close()
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host = "localhost", port = 8000, reload = True)
\ No newline at end of file
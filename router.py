@@ -0,0 +1,175 @@
+import re
+import json
+from datetime import (datetime,
+                      timedelta,
+                      timezone,
+                      )
+
+from servers.data_structures import (MailListInput,
+                                     EventListInput,
+                                     )
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a user message before matching it against the intent patterns.
+
+    Example:
+        normalize_query("  Show me my UNREAD emails? ")
+        # Returns: 'show me my unread emails'
+    """
+    query = query.lower().replace("’", "'")
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.strip(" ?!.,")
+
+
+def day_range(days_from_today: int, days: int) -> tuple[str, str]:
+    """
+    Computes the UTC bounds of a range of local days.
+
+    Parameters:
+        days_from_today (int): The first day of the range (0 is today, 1 is tomorrow).
+        days (int): The number of days in the range.
+
+    Returns:
+        tuple[str, str]: The start and end datetimes in the "%Y-%m-%dT%H:%M:%SZ" format.
+    """
+    now = datetime.now().astimezone()
+    start = now.replace(hour = 0, minute = 0, second = 0, microsecond = 0) + timedelta(days = days_from_today)
+    end = start + timedelta(days = days)
+    return start.astimezone(timezone.utc).strftime(DATE_FORMAT), end.astimezone(timezone.utc).strftime(DATE_FORMAT)
+
+
+def parse_tool_output(output) -> dict|None:
+    """
+    Parses the output of an MCP tool, which is returned as JSON text.
+    """
+    if isinstance(output, list):
+        output = "".join(item if isinstance(item, str) else item.get("text", "") for item in output)
+    if isinstance(output, dict):
+        return output
+    try:
+        return json.loads(output)
+    except (TypeError, json.JSONDecodeError):
+        return None
+
+
+class IntentRouter:
+    """
+    Answers simple, high-frequency requests with a single tool call, bypassing the agent loop.
+
+    Each intent maps a set of regex patterns, matched against the whole normalized message,
+    to a tool call ("get_mail_list" or "get_events") and a response format:
+    "template" formats the result with the intent templates, "llm" lets a cheaper model phrase it.
+    Messages matching no intent go through the full agent.
+    """
+
+    def __init__(self, intents: list[dict], tools: list, llm = None):
+        self.tools = {tool.name: tool for tool in tools}
+        self.llm = llm
+        self.intents = []
+        for intent in intents:
+            if intent["tool"] not in self.tools:
+                print(f"Intent {intent['name']} skipped: tool {intent['tool']} is not available.")
+                continue
+            patterns = [re.compile(pattern) for pattern in intent["patterns"]]
+            self.intents.append((intent, patterns))
+
+    @classmethod
+    def from_file(cls, path: str, tools: list, llm = None) -> "IntentRouter":
+        """
+        Creates a router from a JSON file containing the list of intents.
+        """
+        with open(path, "r") as config:
+            intents = json.load(config)
+        return cls(intents = intents, tools = tools, llm = llm)
+
+    def match(self, query: str) -> dict|None:
+        """
+        Returns the first intent matching the message or None.
+        """
+        normalized = normalize_query(query)
+        for intent, patterns in self.intents:
+            if any(pattern.fullmatch(normalized) for pattern in patterns):
+                return intent
+        return None
+
+    def build_arguments(self, intent: dict) -> dict:
+        """
+        Builds the tool arguments of an intent, validated through the tool input classes.
+        """
+        if intent["tool"] == "get_mail_list":
+            mail_list_input = MailListInput(**intent.get("input", {}))
+            return {"mail_list_input": mail_list_input.model_dump(exclude_none = True)}
+        if intent["tool"] == "get_events":
+            time_min, time_max = day_range(intent.get("days_from_today", 0), intent.get("days", 1))
+            # Expand recurring events, so that each occurrence has its own start time, ordered by the API.
+            event_list = EventListInput(**{"singleEvents": True,
+                                           "orderBy": "startTime",
+                                           **intent.get("input", {}),
+                                           "timeMin": time_min,
+                                           "timeMax": time_max,
+                                           })
+            return {"event_list": event_list.model_dump(exclude_none = True)}
+        raise ValueError(f"Unsupported tool {intent['tool']} for intent {intent['name']}.")
+
+    @staticmethod
+    def items(intent: dict, result: dict) -> list[dict]:
+        """
+        Flattens the tool result into the fields available to the item template.
+        """
+        if intent["tool"] == "get_mail_list":
+            return list(result.values())
+        items = []
+        for event in result.get("items", []):
+            start = event.get("start", {})
+            end = event.get("end", {})
+            items.append({
+                "summary": event.get("summary", "(no title)"),
+                "start": start.get("dateTime", start.get("date")),
+                "end": end.get("dateTime", end.get("date")),
+                "location": event.get("location", ""),
+            })
+        return items
+
+    def render(self, intent: dict, items: list[dict]) -> str:
+        templates = intent["templates"]
+        if not items:
+            return templates["empty"]
+        lines = [templates["header"].format(count = len(items))]
+        for item in items:
+            lines.append(templates["item"].format(**{key: "" if value is None else value for key, value in item.items()}))
+        return "\n".join(lines)
+
+    async def route(self, query: str, config: dict|None = None) -> str|None:
+        """
+        Answers the message through the fast path.
+
+        Parameters:
+            query (str): The user message.
+            config (dict | None, optional): The run configuration passed to the tool (e.g. the session account).
+
+        Returns:
+            str | None: The answer, or None if the message must go through the full agent.
+        """
+        intent = self.match(query)
+        if intent is None:
+            return None
+
+        try:
+            output = await self.tools[intent["tool"]].ainvoke(self.build_arguments(intent), config = config)
+            result = parse_tool_output(output)
+            if result is None:
+                return None
+            items = self.items(intent, result)
+            if intent.get("format") == "llm" and self.llm is not None:
+                response = await self.llm.ainvoke(f"Answer the user request using only the data below. Be concise.\n"
+                                                  f"Request: {query}\nData: {json.dumps(items, default = str)}")
+                return response.content
+            return self.render(intent, items)
+        except Exception as error:
+            # Anything unexpected is left to the full agent.
+            print(f"An exception occurred while routing intent {intent['name']}.\nDetails: \n {error}")
+            return None
@@ -0,0 +1,146 @@
+import asyncio
+from typing import (Awaitable,
+                    Callable,
+                    )
+
+# Session policies
+QUEUE = "queue"          # New messages wait for the running turn to complete.
+SUPERSEDE = "supersede"  # New messages cancel the running turn and the queued ones.
+
+
+class SessionScheduler:
+    """
+    Schedules agent turns across websocket sessions.
+
+    - At most max_concurrency turns run at the same time, the others wait for a free slot.
+    - Each session processes its messages in FIFO order, holding at most max_queue of them.
+    - At most max_pending turns are admitted overall (running, waiting or queued):
+      beyond that new messages are rejected, so load spikes do not pile up work.
+    - When a session is closed, end_session is called with its ID to release its resources (e.g. the agent memory).
+    """
+
+    def __init__(self,
+                 run_turn: Callable[[str, str], Awaitable[str]],
+                 max_concurrency: int = 4,
+                 max_queue: int = 3,
+                 max_pending: int = 32,
+                 policy: str = QUEUE,
+                 end_session: Callable[[str], Awaitable[None]]|None = None,
+                 ):
+        if policy not in (QUEUE, SUPERSEDE):
+            raise ValueError(f"policy must be \"{QUEUE}\" or \"{SUPERSEDE}\". Found {policy}.")
+        self.run_turn = run_turn
+        self.end_session = end_session
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.max_pending = max_pending
+        self.policy = policy
+        self.pending = 0
+
+    def open_session(self, session_id: str, send: Callable[[dict], Awaitable[None]]) -> "Session":
+        """
+        Opens a session and starts its worker.
+
+        Parameters:
+            session_id (str): The session identifier. It is also used as the agent memory thread.
+            send (Callable): Coroutine function sending a JSON message to the client.
+
+        Returns:
+            Session: The opened session.
+        """
+        return Session(scheduler = self, session_id = session_id, send = send)
+
+
+class Session:
+    """
+    A websocket session: a FIFO queue of messages processed one at a time by a worker.
+    """
+
+    def __init__(self, scheduler: SessionScheduler, session_id: str, send: Callable[[dict], Awaitable[None]]):
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self._send = send
+        self.queue = asyncio.Queue(maxsize = scheduler.max_queue)
+        self.current = None
+        self.closed = False
+        self.worker = asyncio.create_task(self._work())
+
+    async def send(self, message: dict) -> None:
+        if self.closed:
+            return
+        try:
+            await self._send(message)
+        except Exception as error:
+            print(f"Could not send message to session {self.session_id}.\nMore info: {error}")
+
+    def _drain(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.scheduler.pending -= 1
+
+    async def submit(self, query: str) -> None:
+        """
+        Admits a message, or rejects it if the session queue or the scheduler are full.
+
+        Parameters:
+            query (str): The user message.
+        """
+        if self.scheduler.policy == SUPERSEDE:
+            self._drain()
+            if self.current is not None:
+                self.current.cancel()
+
+        if self.scheduler.pending >= self.scheduler.max_pending:
+            await self.send({"type": "status", "status": "rejected", "detail": "The assistant is busy, try again later."})
+            return
+        if self.queue.full():
+            await self.send({"type": "status", "status": "rejected", "detail": "Too many pending messages, wait for a reply."})
+            return
+
+        self.scheduler.pending += 1
+        self.queue.put_nowait(query)
+        ahead = self.queue.qsize() - 1 + (self.current is not None)
+        if ahead:
+            await self.send({"type": "status", "status": "queued", "position": ahead})
+
+    async def _work(self) -> None:
+        while True:
+            query = await self.queue.get()
+            self.current = asyncio.create_task(self._run(query))
+            try:
+                # asyncio.wait does not propagate the cancellation of a superseded turn to the worker.
+                await asyncio.wait([self.current])
+            finally:
+                # A turn cancelled before it started never runs, so the count is released here.
+                self.current = None
+                self.scheduler.pending -= 1
+
+    async def _run(self, query: str) -> None:
+        try:
+            if self.scheduler.slots.locked():
+                await self.send({"type": "status", "status": "waiting"})
+            async with self.scheduler.slots:
+                answer = await self.scheduler.run_turn(query, self.session_id)
+            await self.send({"type": "answer", "content": answer})
+        except asyncio.CancelledError:
+            await self.send({"type": "status", "status": "cancelled"})
+            raise
+        except Exception as error:
+            print(f"An exception occurred while running a turn of session {self.session_id}.\nDetails: \n {error}")
+            await self.send({"type": "status", "status": "error", "detail": "Something went wrong, try again."})
+
+    async def close(self) -> None:
+        """
+        Closes the session, cancelling the running turn and dropping the queued ones, 
+        then releases the session resources.
+        """
+        self.closed = True
+        self._drain()
+        tasks = [self.worker]
+        if self.current is not None:
+            tasks.append(self.current)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+        if self.scheduler.end_session is not None:
+            await self.scheduler.end_session(self.session_id)
@@ -0,0 +1,257 @@
+import os
+import asyncio
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import (Any,
+                    AsyncIterator,
+                    Callable,
+                    )
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import AuthorizedSession
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+DEFAULT_ACCOUNT = "default"
+
+
+def account_shard(account: str, shard_count: int) -> int:
+    """
+    Computes the shard an account belongs to.
+
+    Parameters:
+        account (str): The account identifier (e.g. the mailbox address).
+        shard_count (int): The total number of MCP server processes.
+
+    Returns:
+        int: The shard index in the range [0, shard_count).
+    """
+    # crc32 is stable across processes, unlike the built-in hash().
+    return zlib.crc32(account.strip().lower().encode("utf-8")) % shard_count
+
+
+class AccountWorker:
+    """
+    Google service clients of an account bound to their own HTTP connection.
+    The service clients are not thread-safe: a worker serves one call at a time,
+    so its requests can safely run in a thread, off the event loop.
+    """
+
+    def __init__(self, clients: "AccountClients"):
+        self.clients = clients
+        self.http = AuthorizedHttp(clients.creds, http = httplib2.Http())
+        self._services = {}
+        self._session = None
+
+    def service(self, service_name: str, version: str):
+        """
+        Returns the cached service client, building it on first use.
+
+        Parameters:
+            service_name (str): The Google API name (e.g. "gmail", "calendar").
+            version (str): The API version (e.g. "v1", "v3").
+
+        Returns:
+            Resource: The Google API service client.
+        """
+        key = (service_name, version)
+        if key not in self._services:
+            self._services[key] = build(service_name, version, http = self.http)
+        return self._services[key]
+
+    def session(self) -> AuthorizedSession:
+        """
+        Returns an authorized HTTP session, used for raw (e.g. streamed) requests.
+        """
+        if self._session is None:
+            self._session = AuthorizedSession(self.clients.creds)
+        return self._session
+
+    async def execute(self, request):
+        """
+        Executes a Google API request in a thread, so other calls keep running meanwhile.
+
+        Parameters:
+            request (HttpRequest): The request built from one of the worker's service clients.
+
+        Returns:
+            dict: The response.
+        """
+        return await asyncio.to_thread(request.execute)
+
+    def close(self) -> None:
+        for service in self._services.values():
+            service.close()
+        self._services.clear()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class AccountClients:
+    """
+    Credentials and workers of a single account.
+    Up to max_concurrency workers are built lazily and reused across tool calls.
+    """
+
+    def __init__(self, account: str, creds: Credentials, max_concurrency: int):
+        self.account = account
+        self.creds = creds
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_use = 0
+        self._idle_workers = []
+        self._resources = {}
+
+    def take_worker(self) -> AccountWorker:
+        return self._idle_workers.pop() if self._idle_workers else AccountWorker(self)
+
+    def release_worker(self, worker: AccountWorker) -> None:
+        self._idle_workers.append(worker)
+
+    def resource(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Returns a per-account resource (e.g. the mail index), creating it on first use.
+        The resource is released, calling its close() method, when the account is evicted.
+        """
+        if name not in self._resources:
+            self._resources[name] = factory()
+        return self._resources[name]
+
+    def close(self) -> None:
+        for worker in self._idle_workers:
+            worker.close()
+        self._idle_workers.clear()
+        for resource in self._resources.values():
+            if hasattr(resource, "close"):
+                resource.close()
+        self._resources.clear()
+
+
+class AccountPool:
+    """
+    Resolves account identifiers to their credentials and service clients.
+
+    At most max_accounts accounts are kept in memory: when the pool is full the least
+    recently used idle account is evicted. Each account runs at most max_concurrency calls
+    at once, each one in a thread with its own worker, so a busy or slow mailbox cannot
+    block the others.
+    When shard_count > 1, the pool only serves the accounts assigned to shard_index.
+    """
+
+    def __init__(self,
+                 scopes: list[str],
+                 tokens_dir: str = "./servers/tokens",
+                 default_token: str = "./servers/token.json",
+                 max_accounts: int = 100,
+                 max_concurrency: int = 4,
+                 shard_index: int = 0,
+                 shard_count: int = 1,
+                 ):
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"shard_index must be in [0, {shard_count}). Found {shard_index}.")
+        self.scopes = scopes
+        self.tokens_dir = tokens_dir
+        self.default_token = default_token
+        self.max_accounts = max_accounts
+        self.max_concurrency = max_concurrency
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self._accounts: OrderedDict[str, AccountClients] = OrderedDict()
+
+    @classmethod
+    def from_env(cls, scopes: list[str]) -> "AccountPool":
+        """
+        Creates a pool configured through environment variables.
+        """
+        return cls(scopes = scopes,
+                   tokens_dir = os.getenv("TOKENS_DIR", "./servers/tokens"),
+                   default_token = os.getenv("DEFAULT_TOKEN", "./servers/token.json"),
+                   max_accounts = int(os.getenv("ACCOUNT_POOL_SIZE", 100)),
+                   max_concurrency = int(os.getenv("ACCOUNT_MAX_CONCURRENCY", 4)),
+                   shard_index = int(os.getenv("ACCOUNT_SHARD_INDEX", 0)),
+                   shard_count = int(os.getenv("ACCOUNT_SHARD_COUNT", 1)),
+                   )
+
+    def owns(self, account: str) -> bool:
+        """
+        Checks whether the account is served by this process.
+        """
+        return self.shard_count == 1 or account_shard(account, self.shard_count) == self.shard_index
+
+    def token_path(self, account: str) -> str:
+        """
+        Returns the token file of the account.
+        The default account keeps using the single-user token.json.
+        """
+        if account == DEFAULT_ACCOUNT:
+            return self.default_token
+        # Account identifiers are used as file names: reject path traversal.
+        if os.path.basename(account) != account or account.startswith("."):
+            raise ValueError(f"Invalid account identifier: {account}.")
+        return os.path.join(self.tokens_dir, f"{account}.json")
+
+    def _load(self, account: str) -> AccountClients:
+        if not self.owns(account):
+            raise ValueError(f"Account {account} is not served by shard {self.shard_index}/{self.shard_count}.")
+        token_path = self.token_path(account)
+        if not os.path.exists(token_path):
+            raise ValueError(f"No credentials found for account {account}. Run gmail_quickstart.py {account} first.")
+        creds = Credentials.from_authorized_user_file(token_path, self.scopes)
+        return AccountClients(account = account, creds = creds, max_concurrency = self.max_concurrency)
+
+    def _evict(self) -> None:
+        # Walk from the least recently used account and drop idle ones until there is room.
+        for account in list(self._accounts):
+            if len(self._accounts) < self.max_accounts:
+                break
+            clients = self._accounts[account]
+            if clients.in_use == 0:
+                clients.close()
+                del self._accounts[account]
+
+    def get(self, account: str) -> AccountClients:
+        """
+        Returns the clients of the account, loading its credentials if needed.
+
+        Parameters:
+            account (str): The account identifier.
+
+        Returns:
+            AccountClients: The account's credentials and service clients.
+
+        Raises:
+            ValueError: If the account belongs to another shard or has no credentials.
+        """
+        if account in self._accounts:
+            self._accounts.move_to_end(account)
+            return self._accounts[account]
+        self._evict()
+        clients = self._load(account)
+        self._accounts[account] = clients
+        return clients
+
+    @asynccontextmanager
+    async def acquire(self, account: str = DEFAULT_ACCOUNT) -> AsyncIterator[AccountWorker]:
+        """
+        Acquires one of the account's workers for the duration of a call.
+        The account cannot be evicted while one of its workers is acquired.
+
+        Parameters:
+            account (str, optional): The account identifier. Defaults to DEFAULT_ACCOUNT.
+
+        Yields:
+            AccountWorker: The account's service clients for this call.
+        """
+        clients = self.get(account)
+        clients.in_use += 1
+        try:
+            async with clients.semaphore:
+                worker = clients.take_worker()
+                try:
+                    yield worker
+                finally:
+                    clients.release_worker(worker)
+        finally:
+            clients.in_use -= 1
@@ -0,0 +1,262 @@
+import os
+import re
+import base64
+import hashlib
+import tempfile
+from typing import (BinaryIO,
+                    Iterable,
+                    Iterator,
+                    )
+
+from pypdf import PdfReader
+from google.auth.transport.requests import AuthorizedSession
+
+CHUNK_SIZE = 64 * 1024
+# Suffix of the cached attachments cut at the download size budget.
+TRUNCATED_SUFFIX = ".truncated"
+DATA_FIELD = re.compile(rb'"data"\s*:\s*"')
+
+
+def decode_data_stream(chunks: Iterable[bytes], out: BinaryIO, max_bytes: int) -> tuple[int, bool]:
+    """
+    Decodes the base64url "data" field of an attachments().get JSON response while it is being received,
+    so the attachment is never held whole in memory.
+
+    Parameters:
+        chunks (Iterable[bytes]): The raw response body chunks.
+        out (BinaryIO): The file the decoded bytes are written to.
+        max_bytes (int): The maximum number of decoded bytes to write.
+
+    Returns:
+        tuple[int, bool]: The number of bytes written and whether the attachment was truncated.
+    """
+    head = b""
+    pending = b""
+    in_data = False
+    written = 0
+
+    for chunk in chunks:
+        if not in_data:
+            head += chunk
+            match = DATA_FIELD.search(head)
+            if match is None:
+                head = head[-16:] # Keep the tail, the field name could span two chunks.
+                continue
+            chunk = head[match.end():]
+            head = b""
+            in_data = True
+
+        end = chunk.find(b'"')
+        pending += chunk if end == -1 else chunk[:end]
+        # Base64 decodes in groups of 4 characters.
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            decoded = base64.urlsafe_b64decode(pending[:usable])
+            pending = pending[usable:]
+            if written + len(decoded) > max_bytes:
+                out.write(decoded[:max_bytes - written])
+                return max_bytes, True
+            out.write(decoded)
+            written += len(decoded)
+        if end != -1:
+            break
+
+    if pending:
+        pending += b"=" * (-len(pending) % 4) # Gmail could omit "=".
+        decoded = base64.urlsafe_b64decode(pending)[:max_bytes - written]
+        out.write(decoded)
+        written += len(decoded)
+    return written, False
+
+
+class AttachmentCache:
+    """
+    On-disk cache of downloaded attachments, bounded by the total size of its files.
+    When the bound is exceeded, the least recently used files are removed.
+    Attachments cut at the download size budget are stored with the TRUNCATED_SUFFIX.
+    Attachments are keyed by their message part (part ID or file name), since Gmail issues 
+    a new attachment ID each time the message is fetched.
+    """
+
+    def __init__(self, cache_dir: str = "./servers/attachment_cache", max_bytes: int = 200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok = True)
+
+    @classmethod
+    def from_env(cls) -> "AttachmentCache":
+        """
+        Creates a cache configured through environment variables.
+        """
+        return cls(cache_dir = os.getenv("ATTACHMENT_CACHE_DIR", "./servers/attachment_cache"),
+                   max_bytes = int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", 200 * 1024 * 1024)),
+                   )
+
+    def path(self, account: str, mail_id: str, part: str) -> str:
+        """
+        Returns the cache file path of an attachment.
+        """
+        key = hashlib.sha256(f"{account}|{mail_id}|{part}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, account: str, mail_id: str, part: str) -> tuple[str, bool]|None:
+        """
+        Returns the cached file path of an attachment and whether it was truncated, 
+        or None if it is not cached.
+        """
+        path = self.path(account, mail_id, part)
+        for cached_path, truncated in ((path, False), (f"{path}{TRUNCATED_SUFFIX}", True)):
+            if os.path.exists(cached_path):
+                os.utime(cached_path) # Mark as recently used.
+                return cached_path, truncated
+        return None
+
+    def store(self, account: str, mail_id: str, part: str, chunks: Iterable[bytes], max_bytes: int) -> tuple[str, bool]:
+        """
+        Decodes an attachments().get response stream into the cache.
+
+        Parameters:
+            account (str): The account identifier.
+            mail_id (str): The message ID.
+            part (str): The attachment part ID or file name.
+            chunks (Iterable[bytes]): The raw response body chunks.
+            max_bytes (int): The maximum size of the stored attachment.
+
+        Returns:
+            tuple[str, bool]: The cached file path and whether the attachment was truncated.
+        """
+        path = self.path(account, mail_id, part)
+        # A unique temporary file, so concurrent downloads of the same attachment do not collide.
+        fd, tmp_path = tempfile.mkstemp(dir = self.cache_dir, suffix = ".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                _, truncated = decode_data_stream(chunks, out, max_bytes)
+            if truncated:
+                path = f"{path}{TRUNCATED_SUFFIX}"
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path, truncated
+
+    def download(self, 
+                 session: AuthorizedSession, 
+                 uri: str, 
+                 account: str, 
+                 mail_id: str, 
+                 part: str, 
+                 max_bytes: int,
+                 ) -> tuple[str, bool]:
+        """
+        Streams an attachments().get response into the cache. 
+        It is blocking: run it in a thread.
+
+        Parameters:
+            session (AuthorizedSession): The authorized session of the account.
+            uri (str): The attachments().get request URI.
+            account (str): The account identifier.
+            mail_id (str): The message ID.
+            part (str): The attachment part ID or file name.
+            max_bytes (int): The maximum size of the stored attachment.
+
+        Returns:
+            tuple[str, bool]: The cached file path and whether the attachment was truncated.
+        """
+        with session.get(uri, stream = True) as response:
+            response.raise_for_status()
+            return self.store(account, mail_id, part, response.iter_content(chunk_size = CHUNK_SIZE), max_bytes)
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used files until the cache fits its size bound.
+        """
+        # Downloads run concurrently: files may be removed by another eviction meanwhile.
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def detect_format(filename: str|None, mime_type: str|None) -> str|None:
+    """
+    Detects the text format of an attachment.
+
+    Returns:
+        str | None: One of "text", "csv", "pdf" or None if the format is not supported.
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    mime_type = (mime_type or "").lower()
+    if mime_type == "application/pdf" or extension == ".pdf":
+        return "pdf"
+    if mime_type in ("text/csv", "application/csv") or extension == ".csv":
+        return "csv"
+    if mime_type.startswith("text/") or extension in (".txt", ".md", ".log", ".json", ".xml"):
+        return "text"
+    return None
+
+
+def iter_lines(path: str, file_format: str) -> Iterator[str]:
+    """
+    Yields the text lines of an attachment, reading the file incrementally.
+
+    Parameters:
+        path (str): The cached attachment path.
+        file_format (str): The format returned by detect_format().
+
+    Yields:
+        str: The attachment text, one line at a time.
+    """
+    if file_format == "pdf":
+        reader = PdfReader(path)
+        for page in reader.pages:
+            yield from (page.extract_text() or "").splitlines()
+        return
+    with open(path, "r", encoding = "utf-8", errors = "replace", newline = "") as file:
+        for line in file:
+            yield line.rstrip("\r\n")
+
+
+def select_excerpt(lines: Iterable[str], query: str|None, max_chars: int, keep_header: bool = False) -> tuple[str, bool]:
+    """
+    Selects the relevant excerpt of an attachment within a character budget.
+    Without a query the beginning of the text is returned, otherwise only the lines containing
+    at least one of the query terms (case insensitive).
+
+    Parameters:
+        lines (Iterable[str]): The attachment text lines.
+        query (str | None): The terms to look for.
+        max_chars (int): The maximum excerpt length.
+        keep_header (bool, optional): Whether to always keep the first line (e.g. the CSV header).
+
+    Returns:
+        tuple[str, bool]: The excerpt and whether it was cut by the budget.
+    """
+    terms = [term.lower() for term in (query or "").split() if term]
+    excerpt = []
+    size = 0
+    for index, line in enumerate(lines):
+        if not line.strip():
+            continue
+        is_header = keep_header and index == 0
+        if terms and not is_header and not any(term in line.lower() for term in terms):
+            continue
+        if size + len(line) + 1 > max_chars:
+            excerpt.append(line[:max(max_chars - size, 0)])
+            return "\n".join(excerpt), True
+        excerpt.append(line)
+        size += len(line) + 1
+    return "\n".join(excerpt), False
@@ -32,6 +32,10 @@ class EventType(str, Enum):
     outOfOffice = auto()
     workingLocation = auto()
 
+class EventOrderBy(str, Enum):
+    startTime = "startTime"
+    updated = "updated"
+
 class SendMailInput(BaseModel):
     mail_content: str = Field(..., description= "The email body.")
     mail_subject: str = Field(..., description = "Email subject.")
@@ -70,12 +74,28 @@ class MailListInput(BaseModel):
             raise TypeError(f"{v} must be a {str.__name__} or {None.__qualname__}. Found {type(v).__name__}")
         return None
     
+class AttachmentInput(BaseModel):
+    mail_id: str = Field(..., description = "The ID of the email containing the attachment.")
+    attachment_id: str = Field(..., description = "The attachment ID.")
+    part_id: Optional[str] = Field(default = None, description = "The attachment part ID. It identifies the attachment in the local cache.")
+    filename: Optional[str] = Field(default = None, description = "The attachment file name. It is used to detect the file format.")
+    mime_type: Optional[str] = Field(default = None, description = "The attachment MIME type. It is used to detect the file format.")
+    query: Optional[str] = Field(default = None, description = "Terms to look for. Only the lines containing them are returned.")
+    max_chars: int = Field(default = 4000, gt = 0, le = 20000, description = "Maximum number of characters to return.")
+
+class MailSearchInput(BaseModel):
+    query: str = Field(..., description = "What the email is about, in natural language.")
+    top_k: int = Field(default = 5, gt = 0, le = 50, description = "Number of results to retrieve.")
+    filters: Optional[MailListInput] = Field(default = None, description = "Optional filters, as in the mail list search.")
+
 class EventListInput(BaseModel):
     eventTypes: EventType = Field(default = "default", description = "The type of event you want to search.")
     maxResults: int = Field(default = 10, description= "Maximum number of results to retrieve.")
     timeMin: str|None = Field(default = None, description= "Start datetime. The date format is: \"%Y-%m-%dT%H:%M:%SZ\"")
     timeMax: str|None = Field(default = None, description= "End datetime. The date format is: \"%Y-%m-%dT%H:%M:%SZ\"")
     showDeleted: bool| None = Field(default = None, description = "Whether to show deleted events or not.")
+    singleEvents: bool|None = Field(default = None, description = "Whether to expand recurring events into their single occurrences or not.")
+    orderBy: Optional[EventOrderBy] = Field(default = None, description = "The events order. \"startTime\" requires singleEvents.")
     
     class Config:
         use_enum_values = True
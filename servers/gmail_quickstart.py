@@ -1,6 +1,9 @@
 # Run this to generate and update credentials.
 # Credentials will be stored into token.json file.
+# Pass an account identifier to store them into tokens/<account>.json instead:
+#   python servers/gmail_quickstart.py alice@example.com
 import os.path
+import sys
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -13,16 +16,21 @@ load_dotenv()
 SCOPES = [os.getenv("GMAIL_SCOPE"), os.getenv("CALENDAR_SCOPE")] # If modifying these scopes, delete the file token.json.
 
 
-def main():
+def main(account: str|None = None):
   """Shows basic usage of the Gmail API.
   Lists the user's Gmail labels.
   """
   creds = None
+  token_path = "./servers/token.json"
+  if account is not None:
+    tokens_dir = os.getenv("TOKENS_DIR", "./servers/tokens")
+    os.makedirs(tokens_dir, exist_ok=True)
+    token_path = os.path.join(tokens_dir, f"{account}.json")
   # The file token.json stores the user's access and refresh tokens, and is
   # created automatically when the authorization flow completes for the first
   # time.
-  if os.path.exists("./servers/token.json"):
-    creds = Credentials.from_authorized_user_file("./servers/token.json", SCOPES)
+  if os.path.exists(token_path):
+    creds = Credentials.from_authorized_user_file(token_path, SCOPES)
   # If there are no (valid) credentials available, let the user log in.
   if not creds or not creds.valid:
     if creds and creds.expired and creds.refresh_token:
@@ -33,7 +41,7 @@ def main():
       )
       creds = flow.run_local_server(port=0)
     # Save the credentials for the next run
-    with open("./servers/token.json", "w") as token:
+    with open(token_path, "w") as token:
       token.write(creds.to_json())
 
   try:
@@ -54,4 +62,4 @@ def main():
     print(f"An error occurred: {error}")
 
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
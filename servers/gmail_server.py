@@ -10,9 +10,8 @@ load_dotenv()
 SCOPES = [os.getenv("GMAIL_SCOPE"), os.getenv("CALENDAR_SCOPE")]
 
 # Import google libraries
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from requests import RequestException
 # MCP libraries
 from mcp.server.fastmcp import FastMCP, Context
 from mcp.server.elicitation import (
@@ -20,15 +19,39 @@ from mcp.server.elicitation import (
                                     DeclinedElicitation,
                                     CancelledElicitation,
                                     )
-from utils import build_query
+from utils import (build_query,
+                   extract_plain_text,
+                   list_attachments,
+                   strip_quoted_text,
+                   )
+from accounts import (AccountPool,
+                      AccountWorker,
+                      DEFAULT_ACCOUNT,
+                      )
+from vector_index import (MailVectorIndex,
+                          create_embedder,
+                          )
+from attachments import (AttachmentCache,
+                         detect_format,
+                         iter_lines,
+                         select_excerpt,
+                         )
 from data_structures import (SendMailInput,
                             MailListInput,
                             ConfirmOperation,
+                            AttachmentInput,
+                            MailSearchInput,
                             EventListInput,
                             PostEventInput,
                             )
-# Loads google credentials
-creds = Credentials.from_authorized_user_file("./servers/token.json", SCOPES)
+# Resolves each account to its google credentials and service clients
+account_pool = AccountPool.from_env(SCOPES)
+# Bounded on-disk cache for downloaded attachments
+attachment_cache = AttachmentCache.from_env()
+attachment_max_bytes = int(os.getenv("ATTACHMENT_MAX_BYTES", 25 * 1024 * 1024))
+# Local embedding model for semantic search. Vector indexes are opened per account.
+embedder = create_embedder(os.getenv("EMBEDDING_MODEL"))
+mail_index_dir = os.getenv("MAIL_INDEX_DIR", "./servers/mail_index")
 
 mcp = FastMCP("Google services",
               host = "0.0.0.0",
@@ -40,17 +63,21 @@ user_id = "me"
 # TOOLS
 # MAIL TOOLS
 @mcp.tool(title = "Get user info")
-async def get_profile() -> dict|None:
+async def get_profile(account: str = DEFAULT_ACCOUNT) -> dict|None:
     """
     Retrieves the Gmail account information.
 
+    Parameters:
+        account (str, optional): The account identifier. Defaults to "default".
+
     Returns:
         dict | None: The user's profile information as a dictionary or None if an error occurs.
     """
     user_info = None
     try:
-        with build("gmail", "v1", credentials=creds) as gmail_service:
-            user_info = gmail_service.users().getProfile(userId = user_id).execute()
+        async with account_pool.acquire(account) as worker:
+            gmail_service = worker.service("gmail", "v1")
+            user_info = await worker.execute(gmail_service.users().getProfile(userId = user_id))
     except HttpError as error:
         print(f"An HTTP error occurred while calling {get_profile.__name__}.")
         print(f"Details: \n {error}")
@@ -60,6 +87,7 @@ async def get_profile() -> dict|None:
 async def create_draft( mail_content: str,
                         mail_subject: str,
                         mail_dest: str|None = None,
+                        account: str = DEFAULT_ACCOUNT,
                         ) -> dict|None:
     
     """
@@ -69,6 +97,7 @@ async def create_draft( mail_content: str,
         mail_content (str): The body content of the email.
         mail_subject (str): The subject of the email.
         mail_dest (str | None, optional): The recipient's email address. If None, the draft will not have a recipient.
+        account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
         dict | None: The created draft's details as a dictionary or None if an error occurs.
@@ -83,8 +112,9 @@ async def create_draft( mail_content: str,
             message["To"] = mail_dest
         encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
         body = {"message": {"raw": encoded_message}}
-        with build("gmail", "v1", credentials=creds) as gmail_service:
-            draft = gmail_service.users().drafts().create(userId = user_id, body = body).execute()
+        async with account_pool.acquire(account) as worker:
+            gmail_service = worker.service("gmail", "v1")
+            draft = await worker.execute(gmail_service.users().drafts().create(userId = user_id, body = body))
     except HttpError as error:
         print(f"An HTTP error occurred while calling {create_draft.__name__}.")
         print(f"Details: \n {error}")
@@ -96,6 +126,7 @@ async def create_draft( mail_content: str,
 @mcp.tool(title = "Send message with approval")
 async def send_mail(sendmail_input: SendMailInput,
                         context: Context,
+                        account: str = DEFAULT_ACCOUNT,
                             ) -> dict|str| None:   
     """
     Sends an email message, optionally requiring user approval before sending.
@@ -103,6 +134,7 @@ async def send_mail(sendmail_input: SendMailInput,
     Parameters:
         sendmail_input (SendMailInput): The input data for the email (content, subject, recipient and approval flow).
         context (Context): The context for user interaction and approval.
+        account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
         dict | str | None: The sent message's details as a dictionary, a string message if not sent or None if an error occurs.
@@ -135,16 +167,18 @@ async def send_mail(sendmail_input: SendMailInput,
                 case AcceptedElicitation(data = data):
                     if data.confirm:
                     # Send mail
-                        with build("gmail", "v1", credentials=creds) as gmail_service:
-                            mail = gmail_service.users().messages().send(userId = user_id, body = body).execute()
+                        async with account_pool.acquire(account) as worker:
+                            gmail_service = worker.service("gmail", "v1")
+                            mail = await worker.execute(gmail_service.users().messages().send(userId = user_id, body = body))
                     else:
                         return "Mail not sent."
                 case DeclinedElicitation() | CancelledElicitation():
                     return "Mail not sent."
     
         else:
-            with build("gmail", "v1", credentials=creds) as gmail_service:
-                mail = gmail_service.users().messages().send(userId = user_id, body = body).execute()
+            async with account_pool.acquire(account) as worker:
+                gmail_service = worker.service("gmail", "v1")
+                mail = await worker.execute(gmail_service.users().messages().send(userId = user_id, body = body))
 
     except HttpError as error:
         print(f"An HTTP error occurred while calling {send_mail.__name__}.")
@@ -155,27 +189,32 @@ async def send_mail(sendmail_input: SendMailInput,
     return mail
 
 # This is not exposed as tool, but it is called within get_mail_list()
-async def get_mail_details(mail_id: str) ->dict:
+async def get_mail_details(mail_id: str, account: str = DEFAULT_ACCOUNT) ->dict:
     """
     Retrieves the details of a specific email message by its ID.
 
     Parameters:
         mail_id (str): The unique ID of the email message.
+        account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
-        dict: A dictionary containing the mail's ID, subject, body, and date.
+        dict: A dictionary containing the mail's ID, thread ID, subject, sender, body, date and attachments.
     """
 
     try:
-        with build("gmail", "v1", credentials=creds) as gmail_service:
-            mail_details = gmail_service.users().messages().get(userId = user_id, 
+        async with account_pool.acquire(account) as worker:
+            gmail_service = worker.service("gmail", "v1")
+            mail_details = await worker.execute(gmail_service.users().messages().get(userId = user_id, 
                                                                 id = mail_id,
                                                                 format = "full",
-                                                            ).execute()
-        # Fetch subject and date fields
+                                                            ))
+        # Fetch subject, sender and date fields
+        mail_from = None
         for field in mail_details["payload"]["headers"]:
             if field["name"] == "Subject":
                 mail_subject = field["value"]
+            elif field["name"] == "From":
+                mail_from = field["value"]
             elif field["name"] == "Date":
                 mail_date = field["value"].split("+")[0].strip()
         
@@ -200,14 +239,18 @@ async def get_mail_details(mail_id: str) ->dict:
        
     return {
             "mail_id": mail_id,
+            "thread_id": mail_details.get("threadId"),
             "mail_subject": mail_subject,
+            "mail_from": mail_from,
             "mail_body": mail_body,
             "mail_date": mail_date,
+            "attachments": list_attachments(mail_details["payload"]),
             }
 
 @mcp.tool(title = "Mail list")
 async def get_mail_list(
                             mail_list_input: MailListInput,
+                            account: str = DEFAULT_ACCOUNT,
                         )-> dict:
     """
     Retrieves email(s) matching the specified filters.
@@ -223,6 +266,7 @@ async def get_mail_list(
                                                 end_date (str, optional): specifies the earliest date to include in the search results. Use the format: YYYY/MM/DD. (e.g. 2025/04/02)
                                                 max_result (int, default: 10): number of max results to retrieve. 
                                                 include_spam_trash (bool, Default: False): whether to include spam and trash folders in search. 
+        account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
         dict: A dictionary mapping mail IDs to their details.
@@ -241,20 +285,22 @@ async def get_mail_list(
                         label = mail_list_input.label,
                         )
 
-    with build("gmail", "v1", credentials=creds) as gmail_service:
-        mail_list = gmail_service.users().messages().list(userId = user_id, 
+    async with account_pool.acquire(account) as worker:
+        gmail_service = worker.service("gmail", "v1")
+        mail_list = await worker.execute(gmail_service.users().messages().list(userId = user_id, 
                                                         maxResults = mail_list_input.max_result,
                                                         includeSpamTrash = mail_list_input.include_spam_trash,
                                                         q = query,
-                                                        ).execute()
+                                                        ))
     
-    # Get mail details for each mail_id retrieved.
+    # Get mail details for each mail_id retrieved. 
+    # Each task acquires its own worker, so up to ACCOUNT_MAX_CONCURRENCY mails are fetched at once.
     tasks = {}
     try:
         async with asyncio.TaskGroup() as tg:
             for item in mail_list["messages"]:
                 msg_id = item["id"]
-                tasks[msg_id] = tg.create_task(get_mail_details(mail_id = msg_id))
+                tasks[msg_id] = tg.create_task(get_mail_details(mail_id = msg_id, account = account))
     except* HttpError as eg:
         for error in eg.exceptions:
             print(error)
@@ -265,31 +311,406 @@ async def get_mail_list(
     mail_dict = {key: value.result() for key, value in tasks.items()}
     return mail_dict
 
+@mcp.tool(title = "Get mail thread")
+async def get_thread(thread_id: str, account: str = DEFAULT_ACCOUNT) -> dict|None:
+    """
+    Retrieves a whole email conversation in a single call.
+    Quoted replies and signatures are stripped, so each message only contains its new content.
+
+    Parameters:
+        thread_id (str): The thread ID (see "thread_id" in the "Mail list" tool results).
+        account (str, optional): The account identifier. Defaults to "default".
+
+    Returns:
+        dict | None: A dictionary containing the thread ID, subject and the transcript, 
+                     a chronologically ordered list of messages (mail_id, from, to, date, body), 
+                     or None if an error occurs.
+    """
+    thread = None
+    try:
+        async with account_pool.acquire(account) as worker:
+            gmail_service = worker.service("gmail", "v1")
+            thread_details = await worker.execute(gmail_service.users().threads().get(userId = user_id,
+                                                                id = thread_id,
+                                                                format = "full",
+                                                                ))
+        
+        transcript = []
+        messages = sorted(thread_details.get("messages", []), key = lambda message: int(message.get("internalDate", 0)))
+        for message in messages:
+            headers = {field["name"].lower(): field["value"] for field in message["payload"].get("headers", [])}
+            transcript.append({
+                "mail_id": message["id"],
+                "from": headers.get("from"),
+                "to": headers.get("to"),
+                "date": headers.get("date"),
+                "body": strip_quoted_text(extract_plain_text(message["payload"])),
+            })
+        
+        subject = None
+        if messages:
+            subject = next((field["value"] for field in messages[0]["payload"].get("headers", []) if field["name"] == "Subject"), None)
+        thread = {
+            "thread_id": thread_id,
+            "subject": subject,
+            "transcript": transcript,
+        }
+    except HttpError as error:
+        print(f"An HTTP error occurred while calling {get_thread.__name__}.")
+        print(f"Details: \n {error}")
+    except (IndexError, KeyError) as error:
+        print(f"An error occurred while fetching datas from thread during the execution of {get_thread.__name__}.")
+        print(f"Details: \n {error}")
+    return thread
+
+@mcp.tool(title = "Read attachment")
+async def get_attachment(attachment_input: AttachmentInput, account: str = DEFAULT_ACCOUNT) -> dict|None:
+    """
+    Reads the text of an email attachment. Supported formats: plain text, CSV and PDF.
+    The attachment is streamed to a local cache and only the relevant excerpt is returned.
+
+    Parameters:
+        attachment_input (AttachmentInput): a class containing the attachment to read and the excerpt options:
+                                                mail_id (str): the ID of the email containing the attachment.
+                                                attachment_id (str): the attachment ID (see "attachments" in the "Mail list" tool results).
+                                                part_id (str, optional): the attachment part ID (see "attachments" in the "Mail list" tool results).
+                                                filename (str, optional): the attachment file name.
+                                                mime_type (str, optional): the attachment MIME type.
+                                                query (str, optional): terms to look for. If provided, only the lines containing them are returned.
+                                                max_chars (int, default: 4000): maximum number of characters to return.
+        account (str, optional): The account identifier. Defaults to "default".
+
+    Returns:
+        dict | None: A dictionary containing the file name, the excerpt and whether the text was truncated, 
+                     or None if an error occurs.
+    """
+    attachment = None
+    file_format = detect_format(attachment_input.filename, attachment_input.mime_type)
+    if file_format is None:
+        return {"filename": attachment_input.filename, 
+                "excerpt": None, 
+                "error": "Unsupported attachment format. Supported formats: plain text, CSV and PDF.",
+                }
+
+    # The attachment ID changes each time the message is fetched: the cache is keyed by the message part.
+    part = attachment_input.part_id or attachment_input.filename or attachment_input.attachment_id
+    try:
+        cached = attachment_cache.get(account, attachment_input.mail_id, part)
+        if cached is None:
+            async with account_pool.acquire(account) as worker:
+                gmail_service = worker.service("gmail", "v1")
+                request = gmail_service.users().messages().attachments().get(userId = user_id,
+                                                                            messageId = attachment_input.mail_id,
+                                                                            id = attachment_input.attachment_id,
+                                                                            )
+                # Stream the raw response: the client library would load the whole attachment in memory.
+                cached = await asyncio.to_thread(attachment_cache.download,
+                                                 worker.session(),
+                                                 request.uri,
+                                                 account,
+                                                 attachment_input.mail_id,
+                                                 part,
+                                                 attachment_max_bytes,
+                                                 )
+        path, truncated = cached
+
+        # A truncated PDF misses its cross-reference table at the end of the file.
+        if truncated and file_format == "pdf":
+            return {"filename": attachment_input.filename,
+                    "excerpt": None,
+                    "truncated": True,
+                    "error": f"The PDF is larger than {attachment_max_bytes} bytes (ATTACHMENT_MAX_BYTES) and cannot be read.",
+                    }
+
+        # Text extraction (PDF parsing in particular) is blocking as well.
+        excerpt, cut = await asyncio.to_thread(select_excerpt,
+                                               iter_lines(path, file_format),
+                                               query = attachment_input.query,
+                                               max_chars = attachment_input.max_chars,
+                                               keep_header = file_format == "csv",
+                                               )
+        attachment = {
+            "filename": attachment_input.filename,
+            "excerpt": excerpt,
+            "truncated": truncated or cut,
+        }
+    except (HttpError, RequestException) as error:
+        print(f"An HTTP error occurred while calling {get_attachment.__name__}.")
+        print(f"Details: \n {error}")
+    except Exception as error:
+        print(f"An exception occurred while calling {get_attachment.__name__}.")
+        print(f"Details: \n {error}")
+    return attachment
+
+def get_mail_index(worker: AccountWorker) -> MailVectorIndex:
+    """
+    Returns the vector index of the worker's account, opening it on first use.
+    The index is closed when the account is evicted from the pool.
+    """
+    account = worker.clients.account
+    return worker.clients.resource("mail_index", lambda: MailVectorIndex(index_dir = os.path.join(mail_index_dir, account),
+                                                                         dim = embedder.dim,
+                                                                         model_name = embedder.name,
+                                                                         ))
+
+def fetch_messages(gmail_service, mail_ids: list[str], format: str = "full") -> tuple[dict, list[str]]:
+    """
+    Fetches several messages with a single batch HTTP request. 
+    It is blocking: run it in a thread.
+
+    Parameters:
+        gmail_service (Resource): The Gmail service client of a worker.
+        mail_ids (list[str]): The message IDs (at most 100).
+        format (str, optional): The messages format, "full" or "minimal" (labels only). Defaults to "full".
+
+    Returns:
+        tuple[dict, list[str]]: The messages by ID and the IDs of the messages that no longer exist.
+                                Messages that could not be fetched for other reasons are missing from both.
+    """
+    messages = {}
+    not_found = []
+    def store_message(request_id, response, exception):
+        if isinstance(exception, HttpError) and exception.resp.status == 404:
+            not_found.append(request_id)
+        elif exception is not None:
+            print(f"An HTTP error occurred while fetching mail {request_id}.\nDetails: \n {exception}")
+        else:
+            messages[request_id] = response
+
+    batch = gmail_service.new_batch_http_request(callback = store_message)
+    for mail_id in mail_ids:
+        batch.add(gmail_service.users().messages().get(userId = user_id, id = mail_id, format = format), request_id = mail_id)
+    batch.execute()
+    return messages, not_found
+
+def message_labels(message: dict, label_names: dict[str, str]) -> dict:
+    """
+    Returns the label IDs and names of a message, as stored in the mail index.
+    Label names are stored since user label IDs (e.g. "Label_123") differ from the names used in filters.
+    """
+    label_ids = message.get("labelIds", [])
+    return {"labels": label_ids, "label_names": [label_names.get(label_id, label_id) for label_id in label_ids]}
+
+async def list_mail_changes(worker: AccountWorker, gmail_service, history_id: str|None) -> tuple[set[str]|None, set[str]]:
+    """
+    Lists the emails whose labels changed and the emails deleted since a mailbox history ID.
+
+    Parameters:
+        worker (AccountWorker): The worker of the account.
+        gmail_service (Resource): The Gmail service client of the worker.
+        history_id (str | None): The history ID of the last sync.
+
+    Returns:
+        tuple[set[str] | None, set[str]]: The changed and the deleted email IDs. 
+                                          The changed IDs are None when the history is not available 
+                                          (first sync, or history ID older than the history kept by Gmail).
+    """
+    if history_id is None:
+        return None, set()
+    changed, deleted = set(), set()
+    page_token = None
+    try:
+        while True:
+            history = await worker.execute(gmail_service.users().history().list(userId = user_id,
+                                                                             startHistoryId = history_id,
+                                                                             historyTypes = ["messageDeleted", "labelAdded", "labelRemoved"],
+                                                                             pageToken = page_token,
+                                                                             ))
+            for record in history.get("history", []):
+                deleted.update(item["message"]["id"] for item in record.get("messagesDeleted", []))
+                changed.update(item["message"]["id"] for item in record.get("labelsAdded", []) + record.get("labelsRemoved", []))
+            if (page_token := history.get("nextPageToken")) is None:
+                break
+    except HttpError as error:
+        if error.resp.status != 404:
+            raise
+        return None, set()
+    return changed - deleted, deleted
+
+@mcp.tool(title = "Sync mail index")
+async def sync_mail_index(mail_list_input: MailListInput, account: str = DEFAULT_ACCOUNT) -> dict|None:
+    """
+    Adds the emails matching the filters to the local semantic search index. 
+    Emails already indexed are not embedded again, so it can be called again to index new emails only.
+    Each call also refreshes the labels (e.g. read/unread, trash) of the indexed emails and removes the deleted ones,
+    from the mailbox history since the previous call.
+    Emails are fetched with batch requests, in a thread, so the server keeps serving other calls.
+
+    Parameters:
+        mail_list_input (MailListInput): the filters of the emails to index, as in the "Mail list" tool. 
+                                         Use max_result to set how many emails to index (e.g. 500).
+        account (str, optional): The account identifier. Defaults to "default".
+
+    Returns:
+        dict | None: The number of newly indexed, updated and removed emails and the index size, or None if an error occurs.
+    """
+    sync_result = None
+    query = build_query(
+                        recipients=mail_list_input.recipients,
+                        mail_subject = mail_list_input.mail_subject,
+                        start_date = mail_list_input.start_date,
+                        end_date = mail_list_input.end_date,
+                        mail_state = mail_list_input.mail_state,
+                        folder = mail_list_input.folder,
+                        label = mail_list_input.label,
+                        )
+    try:
+        async with account_pool.acquire(account) as worker:
+            gmail_service = worker.service("gmail", "v1")
+            mail_index = get_mail_index(worker)
+            labels = await worker.execute(gmail_service.users().labels().list(userId = user_id))
+            label_names = {label["id"]: label["name"] for label in labels.get("labels", [])}
+            # Changes made from now on are picked up by the next sync.
+            profile = await worker.execute(gmail_service.users().getProfile(userId = user_id))
+            batch_size = 50
+
+            try:
+                # Refresh the labels of the indexed emails and remove the deleted ones.
+                changed_ids, deleted_ids = await list_mail_changes(worker, gmail_service, mail_index.history_id)
+                if changed_ids is None:
+                    # Without history every indexed email is checked.
+                    changed_ids = mail_index.mail_ids()
+                changed_ids = [mail_id for mail_id in changed_ids if mail_id in mail_index]
+                updated = 0
+                for start in range(0, len(changed_ids), batch_size):
+                    messages, not_found = await asyncio.to_thread(fetch_messages, gmail_service, changed_ids[start:start + batch_size], "minimal")
+                    deleted_ids.update(not_found)
+                    changes = [{"mail_id": mail_id, **message_labels(message, label_names)} for mail_id, message in messages.items()]
+                    await asyncio.to_thread(mail_index.update, changes)
+                    updated += len(changes)
+                deleted_ids = [mail_id for mail_id in deleted_ids if mail_id in mail_index]
+                await asyncio.to_thread(mail_index.delete, deleted_ids)
+
+                # Page through the mail list, keeping only the emails not indexed yet.
+                new_ids = []
+                page_token = None
+                listed = 0
+                while listed < mail_list_input.max_result:
+                    mail_list = await worker.execute(gmail_service.users().messages().list(userId = user_id,
+                                                                    maxResults = min(mail_list_input.max_result - listed, 500),
+                                                                    includeSpamTrash = mail_list_input.include_spam_trash,
+                                                                    q = query,
+                                                                    pageToken = page_token,
+                                                                    ))
+                    messages = mail_list.get("messages", [])
+                    listed += len(messages)
+                    new_ids.extend(item["id"] for item in messages if item["id"] not in mail_index)
+                    if not messages or (page_token := mail_list.get("nextPageToken")) is None:
+                        break
+
+                # Fetch, embed and upsert the new emails in batches.
+                indexed = 0
+                for start in range(0, len(new_ids), batch_size):
+                    messages, _ = await asyncio.to_thread(fetch_messages, gmail_service, new_ids[start:start + batch_size])
+                    if not messages:
+                        continue
+                    records, texts = [], []
+                    for mail_id, message in messages.items():
+                        headers = {field["name"].lower(): field["value"] for field in message["payload"].get("headers", [])}
+                        records.append({
+                            "mail_id": mail_id,
+                            "thread_id": message.get("threadId"),
+                            "subject": headers.get("subject"),
+                            "from": headers.get("from"),
+                            "date": int(message.get("internalDate", 0)),
+                            **message_labels(message, label_names),
+                            "snippet": message.get("snippet"),
+                        })
+                        body = strip_quoted_text(extract_plain_text(message["payload"]))
+                        texts.append(f"{headers.get('subject', '')}\n{headers.get('from', '')}\n{body[:4000]}")
+                    # Local embedding models are CPU bound.
+                    vectors = await asyncio.to_thread(embedder.embed, texts)
+                    await asyncio.to_thread(mail_index.upsert, records, vectors)
+                    indexed += len(records)
+                mail_index.history_id = profile["historyId"]
+            finally:
+                # Persist the changes, once per sync.
+                await asyncio.to_thread(mail_index.flush)
+
+        sync_result = {"indexed": indexed, "updated": updated, "removed": len(deleted_ids), "total": len(mail_index)}
+    except HttpError as error:
+        print(f"An HTTP error occurred while calling {sync_mail_index.__name__}.")
+        print(f"Details: \n {error}")
+    except (IndexError, KeyError) as error:
+        print(f"An error occurred while fetching datas from mail during the execution of {sync_mail_index.__name__}.")
+        print(f"Details: \n {error}")
+    return sync_result
+
+@mcp.tool(title = "Semantic mail search")
+async def search_mail(mail_search_input: MailSearchInput, account: str = DEFAULT_ACCOUNT) -> list[dict]:
+    """
+    Finds the emails whose content is closest to a natural language description, 
+    e.g. "the email where the supplier mentioned a price increase". 
+    Only the emails added by the "Sync mail index" tool are searched.
+    Matching paraphrases requires a sentence-transformers model (EMBEDDING_MODEL): 
+    the default hashing model only matches emails sharing words with the description.
+
+    Parameters:
+        mail_search_input (MailSearchInput): a class containing the search options:
+                                                query (str): what the email is about, in natural language.
+                                                top_k (int, default: 5): number of results to retrieve.
+                                                filters (MailListInput, optional): filters on the indexed emails, as in the "Mail list" tool. 
+                                                                                   max_result is ignored, use top_k instead.
+        account (str, optional): The account identifier. Defaults to "default".
+
+    Returns:
+        list[dict]: The matching emails (mail_id, thread_id, subject, from, snippet, score), best first.
+    """
+    async with account_pool.acquire(account) as worker:
+        mail_index = get_mail_index(worker)
+        if len(mail_index) == 0:
+            return []
+        
+        query_vectors = await asyncio.to_thread(embedder.embed, [mail_search_input.query])
+
+        def search():
+            # Holding the index lock, so a concurrent sync cannot change the rows between filtering and scoring.
+            with mail_index.lock:
+                mask = mail_index.filter_mask(mail_search_input.filters)
+                return mail_index.search(query_vectors, top_k = mail_search_input.top_k, mask = mask)[0]
+        results = await asyncio.to_thread(search)
+    return [
+        {
+            "mail_id": record["mail_id"],
+            "thread_id": record.get("thread_id"),
+            "subject": record.get("subject"),
+            "from": record.get("from"),
+            "snippet": record.get("snippet"),
+            "score": round(score, 3),
+        }
+        for record, score in results
+    ]
+
 # CALENDAR TOOLS
 @mcp.tool(title = "Get calendars list")
-async def get_calendars()-> dict|None:
+async def get_calendars(account: str = DEFAULT_ACCOUNT)-> dict|None:
     """
     Retrieves the list of calendars for the authenticated user.
 
+    Parameters:
+        account (str, optional): The account identifier. Defaults to "default".
+
     Returns:
         dict | None: The list of calendars as a dictionary, or None if an error occurs.
     """
     calendars_list = None
     
     try:
-        with build("calendar", "v3", credentials=creds) as calendar_service:
-            calendars_list = calendar_service.calendarList().list().execute() 
+        async with account_pool.acquire(account) as worker:
+            calendar_service = worker.service("calendar", "v3")
+            calendars_list = await worker.execute(calendar_service.calendarList().list()) 
     except HttpError as error:
         print(f"An HTTP error occurred while calling {get_calendars.__name__}.\nError: {error}")
     return calendars_list
 
 @mcp.tool(title = "Get calendar info")
-async def get_my_calendar(calendar_id: str = "primary")-> dict|None:
+async def get_my_calendar(calendar_id: str = "primary", account: str = DEFAULT_ACCOUNT)-> dict|None:
     """
     Retrieves details of a specific calendar.
 
     Parameters:
         calendar_id (str, optional): The calendar's ID. Defaults to "primary".
+        account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
         dict | None: The calendar's details as a dictionary, or None if an error occurs.
@@ -297,14 +718,15 @@ async def get_my_calendar(calendar_id: str = "primary")-> dict|None:
     my_calendar = None
     
     try:
-        with build("calendar", "v3", credentials=creds) as calendar_service:
-            my_calendar = calendar_service.calendarList().get(calendarId = calendar_id).execute() 
+        async with account_pool.acquire(account) as worker:
+            calendar_service = worker.service("calendar", "v3")
+            my_calendar = await worker.execute(calendar_service.calendarList().get(calendarId = calendar_id)) 
     except HttpError as error:
         print(f"An HTTP error occurred while calling {get_my_calendar.__name__}.\nError: {error}")
     return my_calendar
 
 @mcp.tool(title = "Get events")
-async def get_events(event_list: EventListInput, calendar_id: str = "primary")-> dict|None:
+async def get_events(event_list: EventListInput, calendar_id: str = "primary", account: str = DEFAULT_ACCOUNT)-> dict|None:
 
     """
     Retrieves event(s) filtered by the provided criteria from the calendar.
@@ -321,7 +743,10 @@ async def get_events(event_list: EventListInput, calendar_id: str = "primary")->
                                             maxResults (int. Default = 10): the maximum number of events to retrieve from the search.
                                             timeMin (str, optional. Default = None): specifies the earliest date/time to include in the search results. Use the format: %Y-%m-%dT%H:%M:%SZ (e.g., 2025-07-07T14:30:00Z).
                                             timeMax (str, optional. Default = None): specifies the latest date/time to include in the search results. Use the format: %Y-%m-%dT%H:%M:%SZ (e.g., 2025-07-08T14:30:00Z).
+                                            singleEvents (bool, optional. Default = None): whether to expand recurring events into their single occurrences.
+                                            orderBy (str, optional. Default = None): the events order. Values accepted: "startTime" (requires singleEvents), "updated".
         calendar_id (str, optional): The calendar's ID. Defaults to "primary".
+        account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
         dict | None: The list of events as a dictionary, or None if an error occurs.
@@ -331,16 +756,17 @@ async def get_events(event_list: EventListInput, calendar_id: str = "primary")->
     attrs_values = {key: value for key, value in event_list.__dict__.items() if value is not None}
     
     try:
-        with build("calendar", "v3", credentials=creds) as calendar_service:
-            events = calendar_service.events().list(calendarId = calendar_id,
+        async with account_pool.acquire(account) as worker:
+            calendar_service = worker.service("calendar", "v3")
+            events = await worker.execute(calendar_service.events().list(calendarId = calendar_id,
                                                     **attrs_values,
-                                                    ).execute()
+                                                    ))
     except HttpError as error:
         print(f"An HTTP error occurred while calling {get_events.__name__}.\nError: {error}")
     return events
 
 @mcp.tool(title = "Create event")
-async def post_event(post_event_input: PostEventInput, calendar_id: str = "primary") -> dict|None:
+async def post_event(post_event_input: PostEventInput, calendar_id: str = "primary", account: str = DEFAULT_ACCOUNT) -> dict|None:
     """
     Create an event on the calendar with the provided start time and end date.
 
@@ -350,6 +776,8 @@ async def post_event(post_event_input: PostEventInput, calendar_id: str = "prima
                                         end_time (str): the end date of the event. Use the format: %Y-%m-%dT%H:%M:%SZ (e.g., 2025-07-07T15:30:00Z).
                                         attendees (list(str), optional. Default = None): the email(s) list of the attendees.
                                         summary (str, optional. Default = None): The title of the event. It is the event's name displayed on the calendar.
+    - calendar_id (str, optional): The calendar's ID. Defaults to "primary".
+    - account (str, optional): The account identifier. Defaults to "default".
 
     Returns:
         dict | None:                                    
@@ -373,10 +801,11 @@ async def post_event(post_event_input: PostEventInput, calendar_id: str = "prima
         body["summary"] = summary
     
     try:
-        with build("calendar", "v3", credentials=creds) as calendar_service:
-            event = calendar_service.events().insert(calendarId = calendar_id,
+        async with account_pool.acquire(account) as worker:
+            calendar_service = worker.service("calendar", "v3")
+            event = await worker.execute(calendar_service.events().insert(calendarId = calendar_id,
                                                     body = body,
-                                                    ).execute()
+                                                    ))
     except HttpError as error:
             print(f"An HTTP error occurred while calling {post_event.__name__}.\nError: {error}")
 
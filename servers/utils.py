@@ -1,3 +1,8 @@
+import base64
+import re
+
+from bs4 import BeautifulSoup
+
 def build_query(
                 recipients: None|str| list[str] = None,
                 mail_subject: None|str = None,
@@ -65,4 +70,192 @@ def build_query(
         label_filter = f"label:{label}"
         filters_list.append(label_filter)
     
-    return ' '.join(filter for filter in filters_list)
\ No newline at end of file
+    return ' '.join(filter for filter in filters_list)
+
+def decode_body(data: str) -> str:
+    """
+    Decodes a base64url encoded message body.
+
+    Parameters:
+        data (str): The base64url encoded body as returned by Gmail API.
+
+    Returns:
+        str: The decoded text.
+    """
+    data += "=" * (-len(data) % 4) # This check is needed since Gmail could omit "=".
+    return base64.urlsafe_b64decode(data).decode("utf-8", errors = "replace")
+
+
+# Elements of an HTML body holding quoted history or no text: the Gmail quote, 
+# the Outlook reply header (followed by the quoted message) and blockquotes.
+HTML_QUOTE_SELECTORS = ["style", "script", "head", "blockquote", ".gmail_quote", "#divRplyFwdMsg"]
+# Elements rendered on their own lines.
+HTML_BLOCK_TAGS = ["p", "div", "hr", "li", "tr", "table", "ul", "ol", "pre", "h1", "h2", "h3", "h4", "h5", "h6"]
+
+
+def html_to_text(html: str) -> str:
+    """
+    Converts an HTML email body to plain text, without its quoted history.
+    Block elements become line breaks, so the text can be processed line by line like a text/plain body.
+
+    Parameters:
+        html (str): The HTML body.
+
+    Returns:
+        str: The text, with HTML entities decoded.
+
+    Example:
+        html_to_text("<div>Sounds&nbsp;good.</div><div class=\"gmail_quote\">On Mon Bob wrote: ...</div>")
+        # Returns: 'Sounds good.'
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup.select(",".join(HTML_QUOTE_SELECTORS)):
+        if element.decomposed:
+            continue # Already removed with its parent.
+        if element.get("id") == "divRplyFwdMsg":
+            # Outlook puts the quoted message after its reply header.
+            for sibling in list(element.find_next_siblings()):
+                sibling.decompose()
+        element.decompose()
+    for element in soup.find_all("br"):
+        element.replace_with("\n")
+    for element in soup.find_all(HTML_BLOCK_TAGS):
+        element.insert_before("\n")
+        element.insert_after("\n")
+    lines = [line.replace("\xa0", " ").strip() for line in soup.get_text().splitlines()]
+    text = "\n".join(lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def extract_plain_text(payload: dict) -> str:
+    """
+    Extracts the text/plain body of a message payload, walking nested multipart parts.
+    Falls back to the first text/html part, converted to text, if no plain text is found.
+
+    Parameters:
+        payload (dict): The message payload as returned by Gmail API with format "full".
+
+    Returns:
+        str: The message body or an empty string if the message has no text part.
+    """
+    html_body = None
+    parts = [payload]
+    while parts:
+        part = parts.pop(0)
+        mime_type = part.get("mimeType", "")
+        data = part.get("body", {}).get("data")
+        if part.get("filename"):
+            continue # Skip attachments.
+        if mime_type == "text/plain" and data:
+            return decode_body(data)
+        if mime_type == "text/html" and data and html_body is None:
+            html_body = html_to_text(decode_body(data))
+        parts.extend(part.get("parts", []))
+    return html_body or ""
+
+
+def list_attachments(payload: dict) -> list[dict]:
+    """
+    Lists the attachments of a message payload, walking nested multipart parts.
+
+    Parameters:
+        payload (dict): The message payload as returned by Gmail API with format "full".
+
+    Returns:
+        list[dict]: The attachment ID, part ID, file name, MIME type and size of each attachment.
+    """
+    attachments = []
+    parts = [payload]
+    while parts:
+        part = parts.pop(0)
+        body = part.get("body", {})
+        if part.get("filename") and "attachmentId" in body:
+            attachments.append({
+                "attachment_id": body["attachmentId"],
+                "part_id": part.get("partId"),
+                "filename": part["filename"],
+                "mime_type": part.get("mimeType"),
+                "size": body.get("size"),
+            })
+        parts.extend(part.get("parts", []))
+    return attachments
+
+
+# Lines introducing the quoted history of a reply.
+QUOTE_HEADERS = [
+    re.compile(r"^On .+wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^Il giorno .+ha scritto:\s*$", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*Forwarded message\s*-{2,}\s*$", re.IGNORECASE),
+]
+# Outlook divider line, introducing a quoted message only when its header lines follow.
+OUTLOOK_DIVIDER = re.compile(r"^_{10,}\s*$")
+# Lines ending a wrapped "On ... wrote:" header.
+WRAPPED_HEADER_END = re.compile(r"(wrote|ha scritto):\s*$", re.IGNORECASE)
+# Header lines of a forwarded or quoted message (Outlook style), following a "From:" line.
+FORWARD_HEADERS = re.compile(r"^(Sent|Date|To|Cc|Subject|Inviato|Data|A|Oggetto):\s", re.IGNORECASE)
+FROM_HEADER = re.compile(r"^(From|Da):\s.+$", re.IGNORECASE)
+# The standard "-- " signature delimiter only counts within the last lines of the new content,
+# a "--" divider elsewhere is part of the message.
+SIGNATURE_DELIMITER = "-- "
+SIGNATURE_MAX_LINES = 10
+# Lines introducing a signature.
+SIGNATURE_HEADERS = [
+    re.compile(r"^Sent from my .+$", re.IGNORECASE),
+    re.compile(r"^Inviato da .+$", re.IGNORECASE),
+]
+
+
+def is_quote_header(lines: list[str], index: int) -> bool:
+    """
+    Checks whether the line at index introduces the quoted history of a reply.
+    """
+    stripped = lines[index].strip()
+    if any(pattern.match(stripped) for pattern in QUOTE_HEADERS):
+        return True
+    following = [line.strip() for line in lines[index + 1:index + 4]]
+    # Mail clients may wrap the "On ... wrote:" header over two lines:
+    # join them only if the current line does not already end a sentence.
+    if following and not re.search(r"[.!?:;]$", stripped):
+        joined = f"{stripped} {following[0]}"
+        if WRAPPED_HEADER_END.search(joined) and any(pattern.match(joined) for pattern in QUOTE_HEADERS):
+            return True
+    # "From:" starts a quoted message only when other header lines follow it.
+    if FROM_HEADER.match(stripped):
+        return any(FORWARD_HEADERS.match(line) for line in following)
+    # So does the Outlook divider, when followed by the "From:" header lines.
+    if OUTLOOK_DIVIDER.match(stripped):
+        headers = [line.strip() for line in lines[index + 1:index + 6] if line.strip()]
+        return bool(headers) and FROM_HEADER.match(headers[0]) is not None and any(FORWARD_HEADERS.match(line) for line in headers[1:])
+    return False
+
+
+def strip_quoted_text(body: str) -> str:
+    """
+    Removes quoted replies and signatures from an email body, keeping only the new content.
+
+    Parameters:
+        body (str): The plain text email body.
+
+    Returns:
+        str: The body without quoted history and signature.
+
+    Example:
+        strip_quoted_text("Sounds good.\\n\\nOn Mon, 7 Jul 2025 Bob wrote:\\n> Shall we meet?")
+        # Returns: 'Sounds good.'
+    """
+    kept_lines = []
+    lines = body.replace("\r\n", "\n").split("\n")
+    # The new content ends where the quoted history starts.
+    end = next((index for index in range(len(lines)) if is_quote_header(lines, index)), len(lines))
+    for index, line in enumerate(lines[:end]):
+        stripped = line.strip()
+        if line == SIGNATURE_DELIMITER and end - index <= SIGNATURE_MAX_LINES:
+            break
+        if any(pattern.match(stripped) for pattern in SIGNATURE_HEADERS):
+            break
+        if stripped.startswith(">"):
+            continue
+        kept_lines.append(line.rstrip())
+    text = "\n".join(kept_lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
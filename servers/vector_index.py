@@ -0,0 +1,411 @@
+import os
+import re
+import json
+import zlib
+import threading
+from datetime import datetime
+
+import numpy as np
+from numpy.dtypes import StringDType
+
+from data_structures import MailListInput
+
+# Rows scored at once during a search, this bounds the memory used by the score matrix.
+SEARCH_BLOCK_ROWS = 65536
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedding model: words and word bigrams are hashed into a fixed-size vector.
+    It captures lexical overlap only and does not match paraphrases:
+    semantic search requires a sentence-transformers model (see EMBEDDING_MODEL).
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype = np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            tokens = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+            if not tokens:
+                continue
+            hashes = np.array([zlib.crc32(token.encode("utf-8")) for token in tokens], dtype = np.uint32)
+            # The highest bit gives the sign, which reduces the bias of hash collisions.
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        # Sublinear term frequency, then L2 normalization so that dot product is cosine similarity.
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis = 1, keepdims = True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """
+    Local embedding model from the sentence-transformers library (installed separately).
+    """
+
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as error:
+            raise ImportError(f"EMBEDDING_MODEL={model_name} requires the sentence-transformers package.") from error
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size = 32, normalize_embeddings = True).astype(np.float32)
+
+
+def create_embedder(model_name: str|None = None):
+    """
+    Creates the embedding model.
+
+    Parameters:
+        model_name (str | None, optional): "hashing" (default) or a sentence-transformers model name.
+
+    Returns:
+        HashingEmbedder | SentenceTransformerEmbedder: The embedding model.
+    """
+    if model_name is None or model_name == "hashing":
+        return HashingEmbedder()
+    return SentenceTransformerEmbedder(model_name)
+
+
+def grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    """
+    Returns a copy of a 1-D array extended with zeros (or empty strings) up to capacity.
+    """
+    grown = np.zeros(capacity, dtype = array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def to_timestamp(date: str) -> int:
+    """
+    Converts a YYYY/MM/DD date into a timestamp in milliseconds, the unit of Gmail internalDate.
+    """
+    return int(datetime.strptime(date, "%Y/%m/%d").timestamp() * 1000)
+
+
+class MailVectorIndex:
+    """
+    Vector index of a mailbox.
+
+    Vectors are stored in a memory-mapped float32 file, so they are not loaded in memory.
+    The metadata of each mail (used for filtering and results) is appended to a JSON lines log,
+    where the last line of a row wins: upserts never rewrite the whole index.
+    Mails are upserted by ID: a mail already indexed is overwritten in place, 
+    and the rows of deleted mails are reused.
+    The fields used by the filters (labels, date, sender, subject) are also kept as NumPy arrays,
+    so filtering does not loop over the records.
+    The index can be used from several threads: operations are serialized by a lock.
+    """
+
+    def __init__(self, index_dir: str, dim: int, model_name: str):
+        self.index_dir = index_dir
+        self.dim = dim
+        self.model_name = model_name
+        self.vectors_path = os.path.join(index_dir, "vectors.f32")
+        self.meta_path = os.path.join(index_dir, "meta.json")
+        self.records_path = os.path.join(index_dir, "records.jsonl")
+        self.lock = threading.RLock()
+        os.makedirs(index_dir, exist_ok = True)
+
+        # Gmail history ID the index is up to date with, see sync_mail_index.
+        self.history_id = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as meta_file:
+                meta = json.load(meta_file)
+            if meta["dim"] != dim or meta["model"] != model_name:
+                raise ValueError(f"The index in {index_dir} was built with {meta['model']}. Delete it to rebuild it with {model_name}.")
+            self.history_id = meta.get("history_id")
+        else:
+            self._write_meta()
+        self._saved_history_id = self.history_id
+
+        self.records = self._load_records()
+        self.rows = {record["mail_id"]: row for row, record in enumerate(self.records) if record is not None}
+        self.free_rows = [row for row, record in enumerate(self.records) if record is None]
+        self._log = open(self.records_path, "a")
+
+        self.capacity = 0
+        self.vectors = None
+        self.active = np.zeros(0, dtype = bool)
+        self.dates = np.zeros(0, dtype = np.int64)
+        self.senders = np.zeros(0, dtype = StringDType())
+        self.subjects = np.zeros(0, dtype = StringDType())
+        # Lowercased label IDs and names, each with the rows carrying it.
+        self.labels: dict[str, np.ndarray] = {}
+        self._reserve(max(len(self.records), 1024))
+        for row in self.rows.values():
+            self._set_row(row, self.records[row])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, mail_id: str) -> bool:
+        return mail_id in self.rows
+
+    def mail_ids(self) -> list[str]:
+        with self.lock:
+            return list(self.rows)
+
+    def _write_meta(self) -> None:
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as meta_file:
+            json.dump({"dim": self.dim, "model": self.model_name, "history_id": self.history_id}, meta_file)
+        os.replace(tmp_path, self.meta_path)
+
+    def _load_records(self) -> list[dict|None]:
+        if not os.path.exists(self.records_path):
+            return []
+        records = {}
+        log_lines = 0
+        offset = 0
+        truncate_at = None
+        with open(self.records_path, "rb") as log:
+            for line in log:
+                line_offset = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if not line.endswith(b"\n"):
+                        # A crash while appending left a partial last line: drop it.
+                        truncate_at = line_offset
+                    else:
+                        print(f"Skipped a corrupted line of {self.records_path}.")
+                    continue
+                row = entry.pop("row")
+                records[row] = None if entry.get("deleted") else entry
+                log_lines += 1
+        if truncate_at is not None:
+            os.truncate(self.records_path, truncate_at)
+        elif offset and not line.endswith(b"\n"):
+            with open(self.records_path, "a") as log:
+                log.write("\n") # The next appends must start on their own line.
+
+        records = [records.get(row) for row in range(max(records, default = -1) + 1)]
+        # Compact the log when overwritten and deleted mails make up most of it.
+        active = [(row, record) for row, record in enumerate(records) if record is not None]
+        if log_lines > 2 * len(active):
+            tmp_path = f"{self.records_path}.tmp"
+            with open(tmp_path, "w") as log:
+                for row, record in active:
+                    log.write(json.dumps({"row": row, **record}) + "\n")
+            os.replace(tmp_path, self.records_path)
+        return records
+
+    def _reserve(self, capacity: int) -> None:
+        # Grow the vectors file and the filter arrays by doubling, so that upserts are amortized O(1).
+        if capacity <= self.capacity:
+            return
+        new_capacity = max(capacity, self.capacity * 2)
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, "ab") as vectors_file:
+            vectors_file.truncate(new_capacity * self.dim * np.dtype(np.float32).itemsize)
+        self.vectors = np.memmap(self.vectors_path, dtype = np.float32, mode = "r+", shape = (new_capacity, self.dim))
+        self.active = grow(self.active, new_capacity)
+        self.dates = grow(self.dates, new_capacity)
+        self.senders = grow(self.senders, new_capacity)
+        self.subjects = grow(self.subjects, new_capacity)
+        self.labels = {key: grow(rows, new_capacity) for key, rows in self.labels.items()}
+        self.capacity = new_capacity
+
+    @staticmethod
+    def _label_keys(record: dict) -> set[str]:
+        return {label.lower() for label in record.get("labels", []) + record.get("label_names", [])}
+
+    def _set_row(self, row: int, record: dict) -> None:
+        self.active[row] = True
+        self.dates[row] = record.get("date", 0)
+        self.senders[row] = (record.get("from") or "").lower()
+        self.subjects[row] = (record.get("subject") or "").lower()
+        for key in self._label_keys(record):
+            if key not in self.labels:
+                self.labels[key] = np.zeros(self.capacity, dtype = bool)
+            self.labels[key][row] = True
+
+    def _clear_row(self, row: int, record: dict) -> None:
+        self.active[row] = False
+        for key in self._label_keys(record):
+            self.labels[key][row] = False
+
+    def upsert(self, records: list[dict], vectors: np.ndarray) -> None:
+        """
+        Inserts or overwrites mails in the index. Call flush() to persist them.
+
+        Parameters:
+            records (list[dict]): The mails metadata. Each record must contain "mail_id".
+            vectors (np.ndarray): The mails embeddings, one row per record.
+        """
+        with self.lock:
+            self._reserve(len(self.records) + len(records))
+            rows = []
+            for record in records:
+                row = self.rows.get(record["mail_id"])
+                if row is not None:
+                    self._clear_row(row, self.records[row])
+                elif self.free_rows:
+                    row = self.free_rows.pop()
+                else:
+                    row = len(self.records)
+                    self.records.append(None)
+                self.rows[record["mail_id"]] = row
+                self.records[row] = record
+                self._set_row(row, record)
+                rows.append(row)
+            self.vectors[rows] = vectors
+            self._log.writelines(json.dumps({"row": row, **record}) + "\n" for row, record in zip(rows, records))
+
+    def update(self, records: list[dict]) -> None:
+        """
+        Updates the metadata (e.g. the labels) of indexed mails, keeping their embeddings. 
+        Mails not indexed are ignored. Call flush() to persist them.
+
+        Parameters:
+            records (list[dict]): The changed fields of each mail. Each record must contain "mail_id".
+        """
+        with self.lock:
+            lines = []
+            for changes in records:
+                row = self.rows.get(changes["mail_id"])
+                if row is None:
+                    continue
+                record = {**self.records[row], **changes}
+                self._clear_row(row, self.records[row])
+                self.records[row] = record
+                self._set_row(row, record)
+                lines.append(json.dumps({"row": row, **record}) + "\n")
+            self._log.writelines(lines)
+
+    def delete(self, mail_ids: list[str]) -> None:
+        """
+        Removes mails from the index. Their rows are reused by the next upserts. Call flush() to persist it.
+
+        Parameters:
+            mail_ids (list[str]): The IDs of the mails to remove. Mails not indexed are ignored.
+        """
+        with self.lock:
+            lines = []
+            for mail_id in mail_ids:
+                row = self.rows.pop(mail_id, None)
+                if row is None:
+                    continue
+                self._clear_row(row, self.records[row])
+                self.records[row] = None
+                self.free_rows.append(row)
+                lines.append(json.dumps({"row": row, "deleted": True}) + "\n")
+            self._log.writelines(lines)
+
+    def flush(self) -> None:
+        with self.lock:
+            self.vectors.flush()
+            self._log.flush()
+            # The history ID is saved after the records it covers.
+            if self.history_id != self._saved_history_id:
+                self._write_meta()
+                self._saved_history_id = self.history_id
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self._log.close()
+            del self.vectors
+            self.vectors = None
+
+    def filter_mask(self, filters: MailListInput|None) -> np.ndarray:
+        """
+        Computes which mails match the filters.
+
+        Parameters:
+            filters (MailListInput | None): The filters, as used by the "Mail list" tool.
+
+        Returns:
+            np.ndarray: A boolean array with one entry per row of the index.
+        """
+        with self.lock:
+            count = len(self.records)
+
+            def has_label(label: str) -> np.ndarray:
+                rows = self.labels.get(label.lower())
+                return rows[:count] if rows is not None else np.zeros(count, dtype = bool)
+
+            mask = self.active[:count].copy()
+            if filters is None or not filters.include_spam_trash:
+                mask &= ~(has_label("SPAM") | has_label("TRASH"))
+            if filters is None:
+                return mask
+
+            if filters.recipients is not None:
+                recipients = [filters.recipients] if isinstance(filters.recipients, str) else filters.recipients
+                senders = self.senders[:count]
+                mask &= np.logical_or.reduce([np.strings.find(senders, recipient.lower()) >= 0 for recipient in recipients])
+            if filters.mail_subject is not None:
+                mask &= np.strings.find(self.subjects[:count], filters.mail_subject.lower()) >= 0
+            if filters.mail_state is not None:
+                if filters.mail_state == "read":
+                    mask &= ~has_label("UNREAD")
+                else:
+                    mask &= has_label(filters.mail_state)
+            if filters.folder is not None:
+                mask &= has_label(filters.folder)
+            if filters.label is not None:
+                # Records store the label names next to the IDs, since user label IDs look like "Label_123".
+                mask &= has_label(filters.label)
+            if filters.start_date is not None:
+                mask &= self.dates[:count] >= to_timestamp(filters.start_date)
+            if filters.end_date is not None:
+                mask &= self.dates[:count] < to_timestamp(filters.end_date)
+            return mask
+
+    def search(self, queries: np.ndarray, top_k: int = 5, mask: np.ndarray|None = None) -> list[list[tuple[dict, float]]]:
+        """
+        Finds the mails most similar to each query, by cosine similarity.
+        The queries are scored together against blocks of the memory-mapped vectors.
+        It is CPU bound: run it in a thread.
+
+        Parameters:
+            queries (np.ndarray): The normalized query embeddings, one row per query.
+            top_k (int, optional): Number of results per query. Defaults to 5.
+            mask (np.ndarray | None, optional): The mails allowed in the results, see filter_mask().
+
+        Returns:
+            list[list[tuple[dict, float]]]: For each query, the mails metadata and scores, best first.
+        """
+        with self.lock:
+            count = len(self.records)
+            # Deleted rows are never returned. Rows added after the mask was computed are left out.
+            allowed = self.active[:count].copy()
+            if mask is not None:
+                allowed[len(mask):] = False
+                allowed[:len(mask)] &= mask[:count]
+            best_scores = np.full((len(queries), 0), -np.inf, dtype = np.float32)
+            best_rows = np.zeros((len(queries), 0), dtype = np.int64)
+
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, count)
+                scores = queries @ np.asarray(self.vectors[start:end]).T
+                scores[:, ~allowed[start:end]] = -np.inf
+                # Merge the block with the best results so far and keep the top_k.
+                scores = np.concatenate([best_scores, scores], axis = 1)
+                rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), (len(queries), end - start))], axis = 1)
+                if scores.shape[1] > top_k:
+                    top = np.argpartition(-scores, top_k - 1, axis = 1)[:, :top_k]
+                    scores = np.take_along_axis(scores, top, axis = 1)
+                    rows = np.take_along_axis(rows, top, axis = 1)
+                best_scores, best_rows = scores, rows
+
+            results = []
+            for query_scores, query_rows in zip(best_scores, best_rows):
+                order = np.argsort(-query_scores)
+                results.append([(self.records[query_rows[i]], float(query_scores[i])) for i in order if np.isfinite(query_scores[i])])
+            return results
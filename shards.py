@@ -0,0 +1,93 @@
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import (BaseTool,
+                                  StructuredTool,
+                                  )
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from servers.accounts import (account_shard,
+                              DEFAULT_ACCOUNT,
+                              )
+
+
+def dispatcher(shards: dict[int, dict[str, BaseTool]], tool_name: str):
+    """
+    Creates the coroutine routing a tool call to the shard owning the account.
+    """
+    async def dispatch(**arguments):
+        shard = account_shard(arguments.get("account", DEFAULT_ACCOUNT), len(shards))
+        return await shards[shard][tool_name].ainvoke(arguments)
+    return dispatch
+
+
+async def load_tools(client: MultiServerMCPClient, mcp_config: dict) -> list[BaseTool]:
+    """
+    Loads the tools of the MCP servers.
+
+    Servers whose "env" sets ACCOUNT_SHARD_COUNT and ACCOUNT_SHARD_INDEX are shards of the same
+    Google server: their tools are exposed once and each call is routed to the shard owning the
+    "account" argument, using the same hash as the servers.
+
+    Parameters:
+        client (MultiServerMCPClient): The MCP client.
+        mcp_config (dict): The MCP servers configuration.
+
+    Returns:
+        list[BaseTool]: The tools available for the LLM.
+
+    Raises:
+        ValueError: If some shards are missing from the configuration.
+    """
+    tools = []
+    shards = {}
+    shard_count = 0
+    for server_name, server_config in mcp_config.items():
+        server_tools = await client.get_tools(server_name = server_name)
+        env = server_config.get("env", {})
+        if "ACCOUNT_SHARD_COUNT" not in env:
+            tools.extend(server_tools)
+            continue
+        shard_count = int(env["ACCOUNT_SHARD_COUNT"])
+        shards[int(env["ACCOUNT_SHARD_INDEX"])] = {tool.name: tool for tool in server_tools}
+
+    if shards:
+        if sorted(shards) != list(range(shard_count)):
+            raise ValueError(f"Expected one MCP server per shard in [0, {shard_count}). Found shards {sorted(shards)}.")
+        for tool_name, tool in shards[0].items():
+            tools.append(StructuredTool(name = tool_name,
+                                        description = tool.description,
+                                        args_schema = tool.args_schema,
+                                        coroutine = dispatcher(shards, tool_name),
+                                        ))
+    return tools
+
+
+def bind_account(tool: BaseTool) -> BaseTool:
+    """
+    Hides the "account" argument of a tool from the LLM: the account is read from the "account" key
+    of the run configuration, set for each websocket session, so the LLM cannot choose another mailbox.
+    Tool errors (e.g. an account without credentials) are returned to the LLM instead of failing the turn.
+
+    Parameters:
+        tool (BaseTool): The tool loaded from the MCP servers.
+
+    Returns:
+        BaseTool: The tool bound to the session account, or the tool itself if it takes no account.
+    """
+    schema = tool.args_schema if isinstance(tool.args_schema, dict) else tool.args_schema.model_json_schema()
+    if "account" not in schema.get("properties", {}):
+        return tool
+    schema = {**schema,
+              "properties": {name: value for name, value in schema["properties"].items() if name != "account"},
+              "required": [name for name in schema.get("required", []) if name != "account"],
+              }
+
+    async def call(config: RunnableConfig, **arguments):
+        account = config.get("configurable", {}).get("account", DEFAULT_ACCOUNT)
+        return await tool.ainvoke({**arguments, "account": account})
+
+    return StructuredTool(name = tool.name,
+                          description = tool.description,
+                          args_schema = schema,
+                          coroutine = call,
+                          handle_tool_error = True,
+                          )